@@ -1,9 +1,23 @@
 from fastapi import FastAPI, HTTPException, status, UploadFile, Request
-from pydantic import BaseModel
+from pydantic import BaseModel, field_serializer, field_validator
 from typing import Optional, List, Dict
 from sqlalchemy import select, func, delete, desc
 from pathlib import Path
-from database import get_session, AccountModel, AccountUsageRecordModel, init_db
+from database import (
+    get_session,
+    AccountModel,
+    AccountUsageRecordModel,
+    init_db,
+    shutdown_db,
+    DatabaseUnavailableError,
+    parse_created_at,
+    init_pg_pool,
+    close_pg_pool,
+    count_accounts,
+    record_usage,
+    start_usage_writer,
+    stop_usage_writer,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 import uvicorn
@@ -15,8 +29,6 @@ from cursor_pro_keep_alive import main as register_account
 from logger import info, error
 from contextlib import asynccontextmanager
 from tokenManager.cursor import Cursor  # 添加这个导入
-import concurrent.futures
-from functools import lru_cache
 from config import (
     MAX_ACCOUNTS,
     REGISTRATION_INTERVAL,
@@ -66,9 +78,15 @@ background_tasks = {"registration_task": None}
 async def lifespan(app: FastAPI):
     # 启动时初始化数据库
     await init_db()
+    await init_pg_pool()
+    start_usage_writer()
     info(f'服务已启动! \n 首页地址：http://127.0.0.1:{API_PORT}/')
     yield
-    # 关闭时的清理操作
+    # 关闭时的清理操作，先写完待写入的使用记录再释放数据库引擎
+    await stop_usage_writer()
+    await close_pg_pool()
+    await shutdown_db()
+    await Cursor.close()
     info("应用程序已关闭!")
 
 
@@ -101,13 +119,24 @@ class Account(BaseModel):
     token: str
     user: str
     usage_limit: Optional[str] = None
-    created_at: Optional[str] = None
+    created_at: Optional[datetime] = None
     status: str = "active"  # 默认为"active"
     id: Optional[int] = None  # 添加id字段，可选
 
     class Config:
         from_attributes = True
 
+    @field_validator("created_at", mode="before")
+    @classmethod
+    def parse_created_at_value(cls, value):
+        """兼容字符串形式的创建时间，无法解析时视为未提供"""
+        return parse_created_at(value)
+
+    @field_serializer("created_at")
+    def serialize_created_at(self, value):
+        """输出时沿用"%Y-%m-%d %H:%M"格式，与改为datetime之前的接口保持一致"""
+        return format_created_at(value)
+
 
 class AccountResponse(BaseModel):
     success: bool
@@ -115,22 +144,23 @@ class AccountResponse(BaseModel):
     message: str = ""
 
 
+def format_created_at(value: Optional[datetime]) -> Optional[str]:
+    """将创建时间格式化为页面显示使用的"%Y-%m-%d %H:%M"格式"""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone()
+    return value.strftime("%Y-%m-%d %H:%M")
+
+
 async def get_active_account_count() -> int:
     """获取当前账号总数"""
-    async with get_session() as session:
-        result = await session.execute(
-            select(func.count())
-            .select_from(AccountModel)
-            .where(AccountModel.status == "active")
-        )
-        return result.scalar()
+    return await count_accounts(status="active")
 
 
 async def get_account_count() -> int:
     """获取当前账号总数"""
-    async with get_session() as session:
-        result = await session.execute(select(func.count()).select_from(AccountModel))
-        return result.scalar()
+    return await count_accounts()
 
 
 async def run_registration():
@@ -244,10 +274,14 @@ async def root():
             total_balance = 0
             active_accounts = 0
 
-            for acc in accounts:
-                remaining_balance = Cursor.get_remaining_balance(acc.user, acc.token)
-                remaining_days = Cursor.get_trial_remaining_days(acc.user, acc.token)
+            # 并发查询所有账号的使用情况
+            account_statuses = await asyncio.gather(
+                *(Cursor.get_account_status(acc.user, acc.token) for acc in accounts)
+            )
 
+            for acc, (remaining_balance, remaining_days) in zip(
+                accounts, account_statuses
+            ):
                 if remaining_balance is not None and remaining_balance > 0:
                     active_accounts += 1
                     total_balance += remaining_balance
@@ -335,6 +369,8 @@ async def root():
             },
             "timestamp": datetime.now().isoformat(),
         }
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"根端点错误: {str(e)}")
         error(traceback.format_exc())
@@ -411,7 +447,7 @@ async def get_accounts(
                     "token": account.token,
                     "user": account.user if hasattr(account, "user") else "",
                     "usage_limit": account.usage_limit,
-                    "created_at": account.created_at,
+                    "created_at": format_created_at(account.created_at),
                     "status": account.status
                 }
                 accounts_data.append(account_dict)
@@ -431,6 +467,8 @@ async def get_accounts(
                     "order": order
                 }
             }
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"获取账号列表失败: {str(e)}")
         error(traceback.format_exc())
@@ -454,6 +492,8 @@ async def get_random_account():
                 return AccountResponse(success=False, message="No accounts available")
 
             return AccountResponse(success=True, data=Account.from_orm(account))
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"获取随机账号失败: {str(e)}")
         error(traceback.format_exc())
@@ -477,6 +517,8 @@ async def create_account(account: Account):
             return AccountResponse(
                 success=True, data=account, message="Account created successfully"
             )
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"创建账号失败: {str(e)}")
         error(traceback.format_exc())
@@ -517,6 +559,8 @@ async def delete_account(email: str, hard_delete: bool = False):
             await session.commit()
 
             return AccountResponse(success=True, message=delete_message)
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"删除账号失败: {str(e)}")
         error(traceback.format_exc())
@@ -567,6 +611,8 @@ async def update_account_status(id: str, update: StatusUpdate):
                 success=True,
                 message=f"账号 {account.email} 状态已更新为 '{update.status}'",
             )
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"通过邮箱更新账号状态失败: {str(e)}")
         error(traceback.format_exc())
@@ -698,6 +744,8 @@ async def start_registration():
                 "max_accounts": MAX_ACCOUNTS,
             },
         }
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"启动注册任务失败: {str(e)}")
         error(traceback.format_exc())
@@ -805,6 +853,8 @@ async def get_registration_status():
         # info(f"请求注册状态 (当前账号数: {count}, 活跃账号数: {active_count}, 状态: {task_status})")
         return status_info
 
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"获取注册状态失败: {str(e)}")
         error(traceback.format_exc())
@@ -823,6 +873,15 @@ async def http_exception_handler(request, exc):
     )
 
 
+@app.exception_handler(DatabaseUnavailableError)
+async def database_unavailable_handler(request, exc):
+    error(f"数据库不可用: {str(exc)}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"success": False, "message": str(exc)},
+    )
+
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     error(f"意外错误发生: {str(exc)}")
@@ -837,17 +896,24 @@ async def general_exception_handler(request, exc):
     )
 
 
-# 添加缓存装饰器
-@lru_cache(maxsize=100)
-def get_account_status(user: str, token: str, timestamp: int):
+# 账号状态缓存: {(user, token, timestamp): 状态}，最多保留100条
+account_status_cache = {}
+
+
+async def get_account_status(user: str, token: str, timestamp: int):
     """缓存10分钟内的账号状态"""
-    balance = Cursor.get_remaining_balance(user, token)
-    days = Cursor.get_trial_remaining_days(user, token)
-    return {
-        "balance": balance,
-        "days": days,
-        "status": "active" if balance is not None and balance > 0 else "inactive",
-    }
+    key = (user, token, timestamp)
+    if key not in account_status_cache:
+        balance, days = await Cursor.get_account_status(user, token)
+        if len(account_status_cache) >= 100:
+            # 淘汰最早写入的缓存项
+            account_status_cache.pop(next(iter(account_status_cache)))
+        account_status_cache[key] = {
+            "balance": balance,
+            "days": days,
+            "status": "active" if balance is not None and balance > 0 else "inactive",
+        }
+    return account_status_cache[key]
 
 
 # 修改 check_usage 接口
@@ -861,26 +927,24 @@ async def check_usage():
             # 使用当前时间的10分钟间隔作为缓存key
             cache_timestamp = int(datetime.now().timestamp() / 600)
 
-            # 使用线程池并发获取账号状态
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                futures = [
-                    executor.submit(
-                        get_account_status, acc.user, acc.token, cache_timestamp
-                    )
+            # 并发获取账号状态
+            statuses = await asyncio.gather(
+                *(
+                    get_account_status(acc.user, acc.token, cache_timestamp)
                     for acc in accounts
-                ]
-
-                usage_info = []
-                for acc, future in zip(accounts, futures):
-                    status = future.result()
-                    usage_info.append(
-                        {
-                            "email": acc.email,
-                            "usage_limit": status["balance"],
-                            "remaining_days": status["days"],
-                            "status": status["status"],
-                        }
-                    )
+                )
+            )
+
+            usage_info = []
+            for acc, status in zip(accounts, statuses):
+                usage_info.append(
+                    {
+                        "email": acc.email,
+                        "usage_limit": status["balance"],
+                        "remaining_days": status["days"],
+                        "status": status["status"],
+                    }
+                )
 
             return {
                 "total_accounts": len(accounts),
@@ -897,6 +961,8 @@ async def check_usage():
                     ),
                 },
             }
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"检查使用量失败: {str(e)}")
         error(traceback.format_exc())
@@ -919,11 +985,8 @@ async def get_account_usage(email: str):
                     status_code=404, detail=f"Account with email {email} not found"
                 )
 
-            # 获取账号使用量
-            remaining_balance = Cursor.get_remaining_balance(
-                account.user, account.token
-            )
-            remaining_days = Cursor.get_trial_remaining_days(
+            # 并发获取账号剩余额度和试用期剩余天数
+            remaining_balance, remaining_days = await Cursor.get_account_status(
                 account.user, account.token
             )
 
@@ -961,7 +1024,7 @@ async def get_account_usage(email: str):
                 "timestamp": datetime.now().isoformat(),
             }
 
-    except HTTPException:
+    except (HTTPException, DatabaseUnavailableError):
         raise
     except Exception as e:
         error(f"查询账号使用量失败: {str(e)}")
@@ -1002,6 +1065,8 @@ async def delete_account_by_id(id: int, hard_delete: bool = False):
             await session.commit()
 
             return AccountResponse(success=True, message=delete_message)
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"通过ID删除账号失败: {str(e)}")
         error(traceback.format_exc())
@@ -1030,7 +1095,7 @@ async def export_accounts():
                     "token": account.token,
                     "user": account.user,
                     "usage_limit": account.usage_limit,
-                    "created_at": account.created_at,
+                    "created_at": format_created_at(account.created_at),
                     "status": account.status
                 }
                 accounts_data.append(account_dict)
@@ -1043,6 +1108,8 @@ async def export_accounts():
             
             return response
             
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"导出账号失败: {str(e)}")
         error(traceback.format_exc())
@@ -1110,7 +1177,7 @@ async def import_accounts(file: UploadFile):
                         token=account_data.get("token", ""),
                         user=account_data.get("user", ""),
                         usage_limit=account_data.get("usage_limit", ""),
-                        created_at=account_data.get("created_at", datetime.now().strftime("%Y-%m-%d %H:%M")),
+                        created_at=parse_created_at(account_data.get("created_at")) or datetime.now().astimezone(),
                         status=account_data.get("status", "active")
                     )
                     session.add(new_account)
@@ -1124,7 +1191,7 @@ async def import_accounts(file: UploadFile):
             "message": f"导入完成: 新增 {imported} 个账号, 更新 {updated} 个账号, 跳过 {skipped} 个无效记录",
         }
             
-    except HTTPException:
+    except (HTTPException, DatabaseUnavailableError):
         raise
     except Exception as e:
         error(f"导入账号失败: {str(e)}")
@@ -1171,17 +1238,14 @@ async def use_account_token(id: int, request: Request):
                 # 获取用户代理
                 user_agent = request.headers.get("User-Agent", "")
                 
-                # 创建使用记录
-                usage_record = AccountUsageRecordModel(
-                    id=int(time.time() * 1000),  # 使用毫秒级时间戳作为ID
-                    account_id=id,
-                    email=account.email,
-                    ip=client_ip,
-                    user_agent=user_agent,
-                    created_at=datetime.now().isoformat()
-                )
-                session.add(usage_record)
-                await session.commit()
+                # 创建使用记录，由后台任务批量写入数据库
+                await record_usage({
+                    "account_id": id,
+                    "email": account.email,
+                    "ip": client_ip,
+                    "user_agent": user_agent,
+                    "created_at": datetime.now().astimezone()
+                })
 
             if success and patch_success:
                 return {
@@ -1196,6 +1260,8 @@ async def use_account_token(id: int, request: Request):
             else:
                 return {"success": False, "message": "Token更新失败"}
 
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"使用账号Token失败: {str(e)}")
         error(traceback.format_exc())
@@ -1234,7 +1300,7 @@ async def get_account_usage_records(id: int):
                     "email": record.email,
                     "ip": record.ip,
                     "user_agent": record.user_agent,
-                    "created_at": record.created_at
+                    "created_at": record.created_at.isoformat()
                 })
             
             return {
@@ -1242,6 +1308,8 @@ async def get_account_usage_records(id: int):
                 "records": records_list
             }
 
+    except DatabaseUnavailableError:
+        raise
     except Exception as e:
         error(f"获取账号使用记录失败: {str(e)}")
         error(traceback.format_exc())
@@ -1664,5 +1732,6 @@ if __name__ == "__main__":
         access_log=True,
         log_level="error",
         workers=API_WORKERS,
-        loop="asyncio",  # Windows下使用默认的asyncio
+        # 非Windows平台使用uvloop降低事件循环开销，Windows下uvloop不可用，使用默认的asyncio
+        loop="asyncio" if os.name == "nt" else "uvloop",
     )
\ No newline at end of file
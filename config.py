@@ -91,6 +91,22 @@ else:  # Linux/Unix
 
 # 允许通过环境变量覆盖默认的数据库URL
 DATABASE_URL = os.getenv("DATABASE_URL", DATABASE_URL)
+# 连接池常驻连接数（默认 CPU核数*2+1，最大32）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", min(32, (os.cpu_count() or 1) * 2 + 1)))
+# 连接池在常驻连接之外允许临时创建的最大连接数
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+# 连接最长复用时间(秒)，超过后回收重建
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# 等待空闲连接的超时时间(秒)
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+# SQL编译缓存和预编译语句缓存的条目数，重复执行的查询无需再次编译和解析
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 500))
+# PostgreSQL下账号计数使用的asyncpg原生连接池最大连接数，与上面的SQLAlchemy连接池分开计算
+DB_PG_POOL_MAX_SIZE = int(os.getenv("DB_PG_POOL_MAX_SIZE", 3))
+# 连续多少次数据库连接失败后熔断
+DB_BREAKER_FAIL_MAX = int(os.getenv("DB_BREAKER_FAIL_MAX", 5))
+# 熔断持续时间(秒)，到期后放行一次请求试探数据库是否恢复
+DB_BREAKER_RESET_TIMEOUT = int(os.getenv("DB_BREAKER_RESET_TIMEOUT", 30))
 
 # ===== Cursor main.js 配置 =====
 # Cursor 主文件路径
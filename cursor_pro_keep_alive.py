@@ -377,7 +377,7 @@ class EmailGenerator:
 
     def _save_account_info(self, user, token, total_usage):
         try:
-            from database import get_session, AccountModel
+            from database import get_session, shutdown_db, AccountModel
             import asyncio
             import time
 
@@ -412,7 +412,7 @@ class EmailGenerator:
                             token=token,
                             user=user,
                             usage_limit=str(total_usage),
-                            created_at=datetime.now().strftime("%Y-%m-%d %H:%M"),
+                            created_at=datetime.now().astimezone(),
                             status="active",  # 设置默认状态为活跃
                             id=timestamp_ms,  # 设置毫秒时间戳id
                         )
@@ -422,7 +422,14 @@ class EmailGenerator:
                     info(f"账号 {self.email} 信息保存成功")
                     return True
 
-            return asyncio.run(save_to_db())
+            async def save_and_close():
+                try:
+                    return await save_to_db()
+                finally:
+                    # asyncio.run结束后事件循环即关闭，释放本次创建的引擎
+                    await shutdown_db()
+
+            return asyncio.run(save_and_close())
         except Exception as e:
             info(f"保存账号信息失败: {str(e)}")
             return False
@@ -1,9 +1,43 @@
+import os
+import time
+import asyncio
+import weakref
+from datetime import datetime
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Column, String, Text, text, BigInteger, ForeignKey
+from sqlalchemy import (
+    Column,
+    String,
+    Text,
+    BigInteger,
+    DateTime,
+    ForeignKey,
+    Index,
+    event,
+    func,
+    insert,
+    select,
+    text,
+    type_coerce,
+    update,
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError, IntegrityError, InterfaceError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 from contextlib import asynccontextmanager
 from logger import info, error
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_PG_POOL_MAX_SIZE,
+    DB_BREAKER_FAIL_MAX,
+    DB_BREAKER_RESET_TIMEOUT,
+)
 
 
 # 基础模型类 - SQLAlchemy的声明式基类，所有数据库模型都继承自此类
@@ -30,8 +64,8 @@ class AccountModel(Base):
     # 使用限制信息，存储为JSON格式的文本
     usage_limit = Column(Text, nullable=True)
     
-    # 创建时间，存储为文本格式
-    created_at = Column(Text, nullable=True)
+    # 创建时间，使用日期时间类型存储，便于按时间排序和范围查询
+    created_at = Column(DateTime(timezone=True), nullable=True)
     
     # 账号状态，默认为"active"，表示账号可用
     status = Column(String, default="active", nullable=False)
@@ -39,6 +73,11 @@ class AccountModel(Base):
     # 账号ID（毫秒时间戳），用于关联和查询，创建索引提高查询性能
     id = Column(BigInteger, nullable=False, index=True)
 
+    __table_args__ = (
+        # 按状态筛选并按ID排序（如查找下一个可用账号）时可直接走索引
+        Index("ix_accounts_status_id", "status", "id"),
+    )
+
 
 # 账号使用记录模型 - 跟踪账号的使用情况
 class AccountUsageRecordModel(Base):
@@ -47,8 +86,8 @@ class AccountUsageRecordModel(Base):
     # 自增ID作为主键
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     
-    # 关联到AccountModel的id字段，创建索引
-    account_id = Column(BigInteger, nullable=False, index=True)  # 账号ID
+    # 关联到AccountModel的id字段，由复合索引ix_usage_acct_created覆盖
+    account_id = Column(BigInteger, nullable=False)  # 账号ID
     
     # 账号邮箱，用于关联查询，创建索引
     email = Column(String, nullable=False, index=True)  # 账号邮箱
@@ -60,7 +99,30 @@ class AccountUsageRecordModel(Base):
     user_agent = Column(Text, nullable=True)  # 使用者UA
     
     # 记录创建时间，不可为空
-    created_at = Column(Text, nullable=False)  # 创建时间
+    created_at = Column(DateTime(timezone=True), nullable=False)  # 创建时间
+
+    __table_args__ = (
+        # 按账号/邮箱查询并按时间排序或筛选时间范围时，无需额外排序
+        Index("ix_usage_acct_created", "account_id", "created_at"),
+        Index("ix_usage_email_created", "email", "created_at"),
+    )
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    为新建的SQLite连接设置优化参数
+
+    说明:
+        - WAL模式下读写互不阻塞，synchronous=NORMAL减少每次提交的fsync
+        - 临时表放在内存中，并加大内存映射和页缓存
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.close()
 
 
 def create_engine():
@@ -72,20 +134,158 @@ def create_engine():
         
     说明:
         - 使用配置文件中的数据库URL创建引擎
-        - 对于SQLite数据库，设置check_same_thread=False以允许多线程访问
+        - 对于SQLite数据库，设置check_same_thread=False以允许多线程访问，
+          并在每个新连接上启用WAL日志模式等优化参数，读操作不再被写操作阻塞
+        - 显式指定连接池类型，避免随SQLAlchemy版本变化：
+          内存SQLite使用StaticPool共享同一连接，其余使用AsyncAdaptedQueuePool
+        - pool_pre_ping=True在取出连接时校验有效性，失效连接会被自动替换
+        - query_cache_size缓存编译后的SQL，参数化查询只编译一次；
+          PostgreSQL下同时设置asyncpg驱动的预编译语句缓存，重复查询无需再次解析和生成执行计划
         - echo=False关闭SQL语句日志输出
     """
+    if ":memory:" in DATABASE_URL:
+        # 内存数据库只存在于单个连接中，必须共享同一个连接
+        pool_options = {"poolclass": StaticPool}
+    else:
+        pool_options = {
+            "poolclass": AsyncAdaptedQueuePool,
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_timeout": DB_POOL_TIMEOUT,
+        }
+
+    is_sqlite = "sqlite" in DATABASE_URL
+
     # 直接使用配置文件中的数据库URL
+    url = DATABASE_URL
+    if url.startswith("postgresql+asyncpg://"):
+        url = make_url(url).update_query_dict(
+            {"prepared_statement_cache_size": str(DB_STATEMENT_CACHE_SIZE)}
+        )
+
     engine = create_async_engine(
-        DATABASE_URL,
+        url,
         echo=False,
-        connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
+        connect_args={"check_same_thread": False, "timeout": 30} if is_sqlite else {},
         future=True,
+        pool_pre_ping=True,
+        query_cache_size=DB_STATEMENT_CACHE_SIZE,
+        **pool_options,
     )
+
+    if is_sqlite:
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
     # info(f"数据库引擎创建成功: {DATABASE_URL}")
     return engine
 
 
+# 已完成建表的数据库URL，避免重复执行建表和表结构检查
+_initialized_urls = set()
+
+# 进程内共享的引擎缓存: {事件循环: (引擎, 会话工厂)}
+# 按事件循环区分，避免异步连接被其他事件循环（如注册线程中的asyncio.run）复用
+# 记录所属进程ID，fork出的子进程会丢弃继承来的引擎并重新创建
+_engine_pid = None
+_engines = weakref.WeakKeyDictionary()
+
+
+def get_engine():
+    """
+    获取当前进程、当前事件循环共享的数据库引擎和会话工厂
+
+    返回:
+        (引擎, 会话工厂) 元组，首次调用时创建，之后复用
+    """
+    global _engine_pid, _engines
+    pid = os.getpid()
+    if _engine_pid != pid:
+        # 新进程（或fork后的子进程）不复用父进程的连接
+        _engine_pid = pid
+        _engines = weakref.WeakKeyDictionary()
+
+    loop = asyncio.get_running_loop()
+    state = _engines.get(loop)
+    if state is None:
+        engine = create_engine()
+        session_factory = async_sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False
+        )
+        state = _engines[loop] = (engine, session_factory)
+    return state
+
+
+async def shutdown_db():
+    """
+    释放当前事件循环的数据库引擎
+
+    说明:
+        - 在应用关闭时调用，关闭连接池中的所有连接
+        - 一次性的asyncio.run调用在结束前也应调用，避免连接随事件循环泄漏
+    """
+    if _engine_pid != os.getpid():
+        return
+    state = _engines.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state[0].dispose()
+
+
+class DatabaseUnavailableError(Exception):
+    """数据库熔断期间拒绝访问时抛出"""
+
+
+class CircuitBreaker:
+    """
+    数据库熔断器
+
+    连续fail_max次连接类错误后熔断，熔断期间直接拒绝请求而不是逐个等待超时；
+    reset_timeout秒后放行一次请求，成功则恢复，失败则继续熔断
+    """
+
+    def __init__(self, fail_max, reset_timeout):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.fail_count = 0
+        self.opened_at = None
+
+    def before_call(self):
+        """熔断且未到试探时间时抛出DatabaseUnavailableError"""
+        if self.opened_at is None:
+            return
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            raise DatabaseUnavailableError("数据库暂时不可用，请稍后重试")
+        # 到达试探时间，放行本次请求；若再次失败会重新计时
+        self.opened_at = time.monotonic()
+
+    def record_success(self):
+        self.fail_count = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.fail_count += 1
+        if self.fail_count >= self.fail_max:
+            if self.opened_at is None:
+                error(f"数据库连续 {self.fail_count} 次连接失败，熔断 {self.reset_timeout} 秒")
+            self.opened_at = time.monotonic()
+
+
+def _is_connection_error(exc):
+    """
+    判断异常是否表示数据库连接不可用
+
+    说明:
+        - SQLite下"no such table"、语法错误、"database is locked"等SQL错误同样是OperationalError，
+          不能按异常类型判断，只有驱动判定为断线（connection_invalidated）的错误才计入熔断
+        - InterfaceError和连接池取连接超时也视为连接不可用
+    """
+    if isinstance(exc, (InterfaceError, PoolTimeoutError)):
+        return True
+    return isinstance(exc, DBAPIError) and exc.connection_invalidated
+
+
+_db_breaker = CircuitBreaker(DB_BREAKER_FAIL_MAX, DB_BREAKER_RESET_TIMEOUT)
+
+
 @asynccontextmanager
 async def get_session() -> AsyncSession:
     """
@@ -99,37 +299,108 @@ async def get_session() -> AsyncSession:
         AsyncSession实例
         
     异常:
-        捕获并记录数据库连接和操作异常，并确保资源正确释放
+        DatabaseUnavailableError: 数据库连续连接失败而处于熔断状态
+        其余异常原样抛出，会话退出时自动回滚未提交的事务并归还连接
     """
-    # 为每个请求创建新的引擎和会话，确保线程安全
-    engine = create_engine()
-    async_session = async_sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False, future=True
-    )
-
-    session = async_session()
-    try:
-        # 执行简单查询以确保连接有效
-        await session.execute(text("SELECT 1"))
-        yield session
-    except Exception as e:
-        # 记录错误并尝试回滚事务
-        error(f"数据库会话错误: {str(e)}")
-        try:
-            await session.rollback()
-        except Exception as rollback_error:
-            error(f"回滚过程中出错: {str(rollback_error)}")
-        raise
-    finally:
-        # 无论成功与否，都确保关闭会话和释放引擎
+    _db_breaker.before_call()
+    # 复用共享的引擎和连接池，连接有效性由连接池的pool_pre_ping保证
+    _, session_factory = get_engine()
+    async with session_factory() as session:
         try:
-            await session.close()
+            yield session
         except Exception as e:
-            error(f"关闭会话时出错: {str(e)}")
-        try:
-            await engine.dispose()
-        except Exception as e:
-            error(f"释放引擎时出错: {str(e)}")
+            if _is_connection_error(e):
+                _db_breaker.record_failure()
+            else:
+                # SQL错误或业务代码抛出的异常（如HTTPException）说明数据库可以响应
+                _db_breaker.record_success()
+            raise
+        _db_breaker.record_success()
+
+
+def parse_created_at(value):
+    """
+    将字符串形式的创建时间解析为datetime
+
+    参数:
+        value: 时间字符串，兼容"%Y-%m-%d %H:%M"和ISO格式；datetime或None原样返回
+
+    返回:
+        datetime实例，无法解析时返回None
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _migrate_created_at(connection):
+    """
+    将旧版本以文本存储的created_at迁移为日期时间类型
+
+    说明:
+        - SQLite不限制列类型，只需把旧格式的文本改写为SQLAlchemy的日期时间格式
+          （长度固定为26且不含"T"），无法解析的值使用毫秒时间戳id换算
+        - PostgreSQL中将text列转换为timestamptz，不以日期开头的值
+          在账号表中使用id换算，在使用记录表中使用当前时间
+    """
+    for table in (AccountModel.__table__, AccountUsageRecordModel.__table__):
+        if connection.dialect.name == "sqlite":
+            pk = list(table.primary_key.columns)[0]
+            raw = type_coerce(table.c.created_at, Text)
+            rows = connection.execute(
+                select(pk, table.c.id, raw)
+                .where(raw.isnot(None))
+                .where((func.length(raw) != 26) | raw.contains("T"))
+            ).all()
+            for key, row_id, value in rows:
+                created_at = parse_created_at(value)
+                if created_at is None:
+                    created_at = (
+                        datetime.fromtimestamp(row_id / 1000) if row_id else datetime.now()
+                    )
+                elif created_at.tzinfo is not None:
+                    # SQLite中统一按本地时间存储
+                    created_at = created_at.astimezone().replace(tzinfo=None)
+                connection.execute(
+                    update(table).where(pk == key).values(created_at=created_at)
+                )
+            if rows:
+                info(f"已迁移 {table.name} 表中 {len(rows)} 条记录的created_at")
+        elif connection.dialect.name == "postgresql":
+            column_type = connection.execute(
+                text(
+                    "SELECT data_type FROM information_schema.columns "
+                    "WHERE table_name = :table AND column_name = 'created_at'"
+                ),
+                {"table": table.name},
+            ).scalar()
+            if column_type == "text":
+                # 无法识别为日期的旧值不能直接转换，否则整条ALTER失败导致无法启动：
+                # 账号表使用毫秒时间戳id换算，使用记录表（不可为空）使用当前时间
+                fallback = (
+                    "to_timestamp(id / 1000.0)"
+                    if table is AccountModel.__table__
+                    else "now()"
+                )
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table.name} ALTER COLUMN created_at "
+                        "TYPE TIMESTAMP WITH TIME ZONE USING CASE "
+                        "WHEN created_at ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}' "
+                        f"THEN created_at::timestamptz ELSE {fallback} END"
+                    )
+                )
+                info(f"已将 {table.name}.created_at 转换为timestamptz")
+
+
+def _create_missing_indexes(connection):
+    """为已存在的表补建模型中定义但数据库中缺少的索引"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
 
 
 async def init_db():
@@ -139,19 +410,238 @@ async def init_db():
     功能:
         - 根据定义的模型创建数据库表
         - 如果表已存在，不会重新创建
+        - 同一数据库URL在进程内只初始化一次
         
     异常:
         捕获并记录初始化过程中的错误
     """
+    if DATABASE_URL in _initialized_urls:
+        return
+
     try:
-        # 创建数据库引擎
-        engine = create_engine()
+        # 使用共享的数据库引擎，无需单独创建和释放
+        engine, _ = get_engine()
         # 开始事务并创建表
         async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        # 释放引擎资源
-        await engine.dispose()
+            await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+            # 迁移旧版本的文本格式创建时间
+            await conn.run_sync(_migrate_created_at)
+            # create_all不会为已存在的表补建索引，这里单独补建新增的索引
+            await conn.run_sync(_create_missing_indexes)
+        _initialized_urls.add(DATABASE_URL)
         info("数据库初始化成功")
     except Exception as e:
         error(f"数据库初始化失败: {str(e)}")
         raise
+
+
+# 使用记录批量写入：记录先进入队列，由后台任务每100毫秒或每攒够100条写入一次
+USAGE_FLUSH_INTERVAL = 0.1
+USAGE_FLUSH_BATCH_SIZE = 100
+
+# 待写入的使用记录队列和后台写入任务，由start_usage_writer创建
+_usage_queue = None
+_usage_writer_task = None
+
+# 最近分配的使用记录ID，保证同一进程内分配的ID严格递增
+_last_usage_record_id = 0
+
+
+def next_usage_record_id():
+    """
+    分配使用记录ID（毫秒时间戳）
+
+    说明:
+        - SQLite中BIGINT主键不会自增，需要由程序提供ID
+        - 同一毫秒内多次分配时顺延1，避免同一批次中的记录主键冲突
+    """
+    global _last_usage_record_id
+    _last_usage_record_id = max(int(time.time() * 1000), _last_usage_record_id + 1)
+    return _last_usage_record_id
+
+
+async def bulk_insert_usage(records):
+    """
+    批量插入账号使用记录
+
+    参数:
+        records: 使用记录字典列表，字段与AccountUsageRecordModel一致
+
+    说明:
+        - 所有记录在同一个会话中通过一条批量INSERT写入
+        - 批量写入因主键冲突等约束错误失败时，逐条重试，只丢弃出错的记录
+    """
+    if not records:
+        return
+    try:
+        async with get_session() as session:
+            await session.execute(insert(AccountUsageRecordModel), records)
+            await session.commit()
+        return
+    except IntegrityError:
+        if len(records) == 1:
+            raise
+
+    for record in records:
+        try:
+            async with get_session() as session:
+                await session.execute(insert(AccountUsageRecordModel), [record])
+                await session.commit()
+        except IntegrityError as e:
+            error(f"写入使用记录失败(id={record.get('id')}): {str(e)}")
+
+
+async def _usage_writer():
+    """
+    后台写入任务：从队列中攒批并写入数据库，收到None时写完剩余记录后退出
+    """
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        record = await _usage_queue.get()
+        if record is None:
+            break
+
+        batch = [record]
+        deadline = loop.time() + USAGE_FLUSH_INTERVAL
+        while len(batch) < USAGE_FLUSH_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                record = await asyncio.wait_for(_usage_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if record is None:
+                stopping = True
+                break
+            batch.append(record)
+
+        try:
+            await bulk_insert_usage(batch)
+        except Exception as e:
+            error(f"批量写入使用记录失败({len(batch)}条): {str(e)}")
+
+
+def start_usage_writer():
+    """
+    启动使用记录的后台批量写入任务，在应用启动时调用
+    """
+    global _usage_queue, _usage_writer_task
+    if _usage_writer_task is not None and not _usage_writer_task.done():
+        return
+    _usage_queue = asyncio.Queue()
+    _usage_writer_task = asyncio.create_task(_usage_writer())
+
+
+async def stop_usage_writer():
+    """
+    停止后台写入任务，在应用关闭时调用，队列中剩余的记录会先写入数据库
+    """
+    global _usage_queue, _usage_writer_task
+    if _usage_writer_task is None:
+        return
+    await _usage_queue.put(None)
+    await _usage_writer_task
+    _usage_queue = None
+    _usage_writer_task = None
+
+
+async def record_usage(record):
+    """
+    记录一条账号使用记录
+
+    参数:
+        record: 使用记录字典，字段与AccountUsageRecordModel一致
+
+    说明:
+        - 未提供id时自动分配
+        - 后台写入任务运行时放入队列批量写入，否则直接写入数据库
+    """
+    if record.get("id") is None:
+        record = {**record, "id": next_usage_record_id()}
+    if _usage_writer_task is not None and not _usage_writer_task.done():
+        _usage_queue.put_nowait(record)
+    else:
+        await bulk_insert_usage([record])
+
+
+# PostgreSQL下热点只读查询使用的asyncpg原生连接池，绕过ORM编译开销
+# 仅在创建它的事件循环中使用，其他事件循环回退到SQLAlchemy
+_pg_pool = None
+_pg_pool_loop = None
+
+
+async def init_pg_pool():
+    """
+    创建asyncpg原生连接池，在应用启动时调用
+
+    说明:
+        - 仅当DATABASE_URL使用postgresql+asyncpg驱动时创建，SQLite下不做任何事
+        - 只服务两条计数查询，连接数由DB_PG_POOL_MAX_SIZE单独限制，
+          避免在SQLAlchemy连接池之外每个worker再占用DB_POOL_SIZE个连接
+        - asyncpg会按连接缓存预编译语句，查询均使用$n参数占位，重复查询无需再次解析
+    """
+    global _pg_pool, _pg_pool_loop
+    if not DATABASE_URL.startswith("postgresql+asyncpg://") or _pg_pool is not None:
+        return
+
+    import asyncpg
+
+    url = make_url(DATABASE_URL)
+    _pg_pool = await asyncpg.create_pool(
+        dsn=url.set(drivername="postgresql").render_as_string(hide_password=False),
+        min_size=1,
+        max_size=DB_PG_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=300,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+    )
+    _pg_pool_loop = asyncio.get_running_loop()
+    info("asyncpg连接池创建成功")
+
+
+async def close_pg_pool():
+    """
+    关闭asyncpg原生连接池，在应用关闭时调用
+    """
+    global _pg_pool, _pg_pool_loop
+    if _pg_pool is not None:
+        await _pg_pool.close()
+        _pg_pool = None
+        _pg_pool_loop = None
+
+
+def _get_pg_pool():
+    """
+    返回当前事件循环可用的asyncpg连接池，不可用时返回None
+    """
+    if _pg_pool is not None and _pg_pool_loop is asyncio.get_running_loop():
+        return _pg_pool
+    return None
+
+
+async def count_accounts(status=None):
+    """
+    统计账号数量
+
+    参数:
+        status: 只统计指定状态的账号，为None时统计全部账号
+
+    返回:
+        账号数量
+    """
+    pool = _get_pg_pool()
+    if pool is not None:
+        async with pool.acquire() as conn:
+            if status is None:
+                return await conn.fetchval("SELECT count(*) FROM accounts")
+            return await conn.fetchval(
+                "SELECT count(*) FROM accounts WHERE status = $1", status
+            )
+
+    query = select(func.count()).select_from(AccountModel)
+    if status is not None:
+        query = query.where(AccountModel.status == status)
+    async with get_session() as session:
+        result = await session.execute(query)
+        return result.scalar()
@@ -1,7 +1,7 @@
 import asyncio
 import time
 from sqlalchemy import select
-from database import init_db, get_session, AccountModel
+from database import init_db, get_session, shutdown_db, AccountModel
 
 
 async def migrate_add_id():
@@ -27,6 +27,8 @@ async def migrate_add_id():
         await session.commit()
         print("迁移完成")
 
+    await shutdown_db()
+
 
 if __name__ == "__main__":
     asyncio.run(migrate_add_id())
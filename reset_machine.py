@@ -1,8 +1,10 @@
 import os
 import sys
-import json
+import time
+import mmap
+import shutil
 import uuid
-import hashlib
+import orjson
 from colorama import Fore, Style, init
 
 # 初始化colorama用于终端彩色输出
@@ -48,19 +50,21 @@ class MachineIDResetter:
         生成新的机器标识ID
         包括设备ID、机器ID、MAC机器ID和SQM ID，这些ID用于Cursor的识别和统计
         """
-        # 生成新的UUID作为设备ID
-        dev_device_id = str(uuid.uuid4())
+        # 一次性从系统安全随机数源读取全部所需字节，再切片生成各个ID
+        # 各ID仍来自同一次CSPRNG读取的互不重叠部分，安全性与分别读取相同
+        buf = os.urandom(128)
+
+        # 生成新的UUID作为设备ID（设置version=4，与uuid4()格式一致）
+        dev_device_id = str(uuid.UUID(bytes=buf[:16], version=4))
+
+        # 生成新的sqmId (带花括号的UUID，通常用于Microsoft软件质量监控)
+        sqm_id = "{" + str(uuid.UUID(bytes=buf[16:32], version=4)).upper() + "}"
 
         # 生成新的machineId (64个字符的十六进制字符串)
-        # 使用SHA-256哈希算法处理随机字节
-        machine_id = hashlib.sha256(os.urandom(32)).hexdigest()
+        machine_id = buf[32:64].hex()
 
         # 生成新的macMachineId (128个字符的十六进制字符串)
-        # 使用SHA-512哈希算法处理随机字节，生成更长的哈希值
-        mac_machine_id = hashlib.sha512(os.urandom(64)).hexdigest()
-
-        # 生成新的sqmId (带花括号的UUID，通常用于Microsoft软件质量监控)
-        sqm_id = "{" + str(uuid.uuid4()).upper() + "}"
+        mac_machine_id = buf[64:128].hex()
 
         # 返回包含所有生成ID的字典
         return {
@@ -70,6 +74,58 @@ class MachineIDResetter:
             "telemetry.sqmId": sqm_id,
         }
 
+    def load_config(self):
+        """
+        读取并解析配置文件
+        通过内存映射直接解析文件内容，避免先把整个文件复制到内存中
+        """
+        with open(self.db_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # 空文件无法映射，交给orjson报告解析错误
+                return orjson.loads(b"")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
+
+    def save_config(self, config):
+        """
+        将配置原子地写回配置文件
+        先写入临时文件并落盘，再替换原文件，避免写入中途出错或断电导致配置文件被截断
+        """
+        data = orjson.dumps(config, option=orjson.OPT_INDENT_2)
+        tmp_path = self.db_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+                f.flush()
+                # 确保数据在替换前已写入磁盘，否则断电后可能得到空文件
+                os.fsync(f.fileno())
+
+            # 保留原文件的权限位（如用户设置的0600），否则替换后会变为umask默认权限
+            shutil.copymode(self.db_path, tmp_path)
+
+            # Windows下Cursor可能短暂占用配置文件，替换失败时稍后重试
+            attempts = 5 if sys.platform == "win32" else 1
+            for attempt in range(attempts):
+                try:
+                    os.replace(tmp_path, self.db_path)
+                    break
+                except PermissionError:
+                    if attempt == attempts - 1:
+                        raise
+                    time.sleep(0.2)
+
+            if sys.platform != "win32":
+                # 同步所在目录，使替换操作本身也持久化
+                dir_fd = os.open(os.path.dirname(self.db_path), os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
     def reset_machine_ids(self):
         """
         重置机器标识ID的主要方法
@@ -97,20 +153,24 @@ class MachineIDResetter:
 
             # 读取当前的配置文件内容
             print(f"{Fore.CYAN}{EMOJI['FILE']} 读取当前配置...{Style.RESET_ALL}")
-            with open(self.db_path, "r", encoding="utf-8") as f:
-                config = json.load(f)
+            config = self.load_config()
 
             # 生成新的机器标识ID
             print(f"{Fore.CYAN}{EMOJI['RESET']} 生成新的机器标识...{Style.RESET_ALL}")
             new_ids = self.generate_new_ids()
 
-            # 使用新生成的ID更新配置
-            config.update(new_ids)
+            if all(config.get(key) == value for key, value in new_ids.items()):
+                # 配置中的机器标识与生成的完全一致，无需重写文件
+                print(
+                    f"{Fore.YELLOW}{EMOJI['INFO']} 机器标识未发生变化，跳过保存{Style.RESET_ALL}"
+                )
+            else:
+                # 使用新生成的ID更新配置
+                config.update(new_ids)
 
-            # 将更新后的配置保存回文件
-            print(f"{Fore.CYAN}{EMOJI['FILE']} 保存新配置...{Style.RESET_ALL}")
-            with open(self.db_path, "w", encoding="utf-8") as f:
-                json.dump(config, f, indent=4)
+                # 将更新后的配置保存回文件
+                print(f"{Fore.CYAN}{EMOJI['FILE']} 保存新配置...{Style.RESET_ALL}")
+                self.save_config(config)
 
             # 显示成功消息
             print(f"{Fore.GREEN}{EMOJI['SUCCESS']} 机器标识重置成功！{Style.RESET_ALL}")
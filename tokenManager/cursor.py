@@ -1,4 +1,49 @@
-import requests
+import time
+import asyncio
+import hashlib
+import functools
+import httpx
+import orjson
+from urllib.parse import quote
+
+
+def _ttl_cache(ttl=30, maxsize=1024):
+    """
+    为异步类方法(cls, user, token)缓存结果的装饰器
+
+    参数:
+        ttl: 缓存有效期(秒)
+        maxsize: 缓存条目数上限，超出时先清理过期条目
+
+    说明:
+        - 缓存键为user和token的MD5摘要，避免在内存中明文保存令牌
+        - 同一账号在有效期内的重复查询直接返回缓存结果，不发起网络请求
+    """
+
+    def decorator(func):
+        cache = {}
+
+        @functools.wraps(func)
+        async def wrapper(cls, user, token):
+            key = hashlib.md5(f"{user}:{token}".encode()).hexdigest()
+            now = time.monotonic()
+            entry = cache.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+            value = await func(cls, user, token)
+            if len(cache) >= maxsize:
+                # 清理已过期的条目，仍然超限时清空
+                for expired_key in [k for k, (exp, _) in cache.items() if exp <= now]:
+                    del cache[expired_key]
+                if len(cache) >= maxsize:
+                    cache.clear()
+            cache[key] = (now + ttl, value)
+            return value
+
+        return wrapper
+
+    return decorator
 
 
 class Cursor:
@@ -7,8 +52,8 @@ class Cursor:
     提供对Cursor账户信息、使用额度和订阅状态的访问
     """
     
-    # Cursor支持的AI模型列表
-    models = [
+    # Cursor支持的AI模型集合（frozenset，成员判断为O(1)）
+    models = frozenset([
         "claude-3-5-sonnet-20241022",  # Claude 3.5 Sonnet (特定版本)
         "claude-3-opus",               # Claude 3 Opus模型
         "claude-3.5-haiku",            # Claude 3.5 Haiku模型 
@@ -29,10 +74,72 @@ class Cursor:
         "o1-mini",                     # Anthropic O1 Mini模型
         "o1-preview",                  # Anthropic O1预览版
         "o3-mini",                     # Anthropic O3 Mini模型
-    ]
+    ])
+
+    # 所有API请求共用的请求头，作为共享客户端的默认请求头，每次请求只需附加Cookie
+    # 请求压缩响应，减少传输体积
+    _base_headers = {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, br",
+    }
+
+    # 认证Cookie模板，user和token之间以URL编码的"::"（%3A%3A）分隔
+    _COOKIE_FMT = "WorkosCursorSessionToken={user}%3A%3A{token}"
+
+    # 共享的异步HTTP客户端，复用TCP/TLS连接且不阻塞事件循环，首次使用时创建
+    # 启用HTTP/2，同一账号的两个接口请求在一条连接上多路复用
+    _client = None
+
+    # 请求超时时间(秒)：连接超时3.05秒，其余10秒
+    _timeout = httpx.Timeout(10, connect=3.05)
+
+    @classmethod
+    def _get_client(cls):
+        """
+        获取共享的异步HTTP客户端
+
+        返回:
+            httpx.AsyncClient实例，连接失败时自动重试
+        """
+        if cls._client is None or cls._client.is_closed:
+            transport = httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=3,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            )
+            cls._client = httpx.AsyncClient(
+                transport=transport,
+                timeout=cls._timeout,
+                headers=cls._base_headers,
+            )
+        return cls._client
 
     @classmethod
-    def get_remaining_balance(cls, user, token):
+    def _auth_headers(cls, user, token):
+        """
+        构建认证请求头
+
+        返回:
+            只包含认证Cookie的请求头，其余请求头由共享客户端提供
+        """
+        cookie = cls._COOKIE_FMT.format(
+            user=quote(user, safe=""), token=quote(token, safe="")
+        )
+        return {"Cookie": cookie}
+
+    @classmethod
+    async def close(cls):
+        """
+        关闭共享的HTTP客户端，在应用关闭时调用
+        """
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
+
+    @classmethod
+    @_ttl_cache(ttl=30)
+    async def get_remaining_balance(cls, user, token):
         """
         获取用户剩余的API使用额度
         
@@ -46,17 +153,14 @@ class Cursor:
         # 构建API请求URL，包含用户参数
         url = f"https://www.cursor.com/api/usage?user={user}"
 
-        # 设置请求头，包含内容类型和认证Cookie
-        headers = {
-            "Content-Type": "application/json",
-            "Cookie": f"WorkosCursorSessionToken={user}%3A%3A{token}",
-        }
+        # 设置请求头，包含认证Cookie
+        headers = cls._auth_headers(user, token)
         
         # 发送GET请求获取使用情况
-        response = requests.get(url, headers=headers)
+        response = await cls._get_client().get(url, headers=headers)
         
         # 从响应中提取GPT-4的使用情况
-        usage = response.json().get("gpt-4", None)
+        usage = orjson.loads(response.content).get("gpt-4", None)
         
         # 检查是否成功获取到使用数据
         if (
@@ -70,7 +174,8 @@ class Cursor:
         return usage["maxRequestUsage"] - usage["numRequests"]
 
     @classmethod
-    def get_trial_remaining_days(cls, user, token):
+    @_ttl_cache(ttl=30)
+    async def get_trial_remaining_days(cls, user, token):
         """
         获取用户试用期剩余天数
         
@@ -84,15 +189,30 @@ class Cursor:
         # Stripe支付系统API的URL
         url = "https://www.cursor.com/api/auth/stripe"
 
-        # 设置请求头，包含内容类型和认证Cookie
-        headers = {
-            "Content-Type": "application/json",
-            "Cookie": f"WorkosCursorSessionToken={user}%3A%3A{token}",
-        }
+        # 设置请求头，包含认证Cookie
+        headers = cls._auth_headers(user, token)
         
         # 发送GET请求获取订阅信息
-        response = requests.get(url, headers=headers)
+        response = await cls._get_client().get(url, headers=headers)
         
         # 从响应中提取试用期剩余天数
-        remaining_days = response.json().get("daysRemainingOnTrial", None)
+        remaining_days = orjson.loads(response.content).get("daysRemainingOnTrial", None)
         return remaining_days
+
+    @classmethod
+    async def get_account_status(cls, user, token):
+        """
+        并发获取用户剩余额度和试用期剩余天数
+        
+        参数:
+            user: 用户ID或用户名
+            token: 用户认证令牌
+            
+        返回:
+            (剩余的API请求次数, 试用期剩余天数) 元组，无法获取的项为None
+        """
+        balance, days = await asyncio.gather(
+            cls.get_remaining_balance(user, token),
+            cls.get_trial_remaining_days(user, token),
+        )
+        return balance, days